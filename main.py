@@ -1,72 +1,107 @@
 import asyncio
 import csv
+import functools
+import importlib.util
 import logging
+import os
 import re
 import json
 import argparse
+import sys
 from pathlib import Path
-from dataclasses import dataclass, fields, astuple
+from dataclasses import dataclass, fields
+from operator import attrgetter
 from typing import Any
 import httpx
 
+# 可选依赖：uvloop (POSIX) / winloop (Windows) 提供更快的事件循环，未安装时回退到标准 asyncio
+try:
+    if sys.platform == "win32":
+        from winloop import run as run_event_loop
+    else:
+        from uvloop import run as run_event_loop
+except ImportError:
+    run_event_loop = asyncio.run
+
+# 可选依赖：orjson 直接解析字节，比标准库 json 更快，未安装时回退到标准库
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads_json(content: bytes) -> Any:
+    """解析 JSON 字节串，优先使用 orjson"""
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def dumps_json(data: Any) -> bytes:
+    """序列化为紧凑的 UTF-8 JSON 字节串（不转义非 ASCII 字符），优先使用 orjson"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    # 使用 separators 生成紧凑的 JSON (无多余空格)，与 orjson 的输出格式一致
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
 # TODO: 添加model
 
 # --- 配置模块 ---
 
 # 可配置的常量
 BASE_API_URL: str = "https://api.kivo.wiki/api/v1/data"
-CHAR_API_BASE_URL: str = f"{BASE_API_URL}/students/{{student_id}}"
-SPINE_API_BASE_URL: str = f"{BASE_API_URL}/spines/{{spine_id}}"
-STUDENTS_LIST_API_URL: str = f"{BASE_API_URL}/students/?id_sort=desc"
+# 单项接口使用 %d 模板，拼接比 str.format 的具名字段解析更轻
+CHAR_API_BASE_URL: str = f"{BASE_API_URL}/students/%d"
+SPINE_API_BASE_URL: str = f"{BASE_API_URL}/spines/%d"
+STUDENTS_LIST_API_URL: str = f"{BASE_API_URL}/students/"
 SPINES_LIST_API_URL: str = f"{BASE_API_URL}/spines/"
 
 # 从API获取最新的学生ID
-async def get_final_student_id() -> int:
+async def get_final_student_id(client: httpx.AsyncClient) -> int:
     """从API获取最新的学生ID（最大的ID）"""
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(STUDENTS_LIST_API_URL, timeout=10.0)
-            response.raise_for_status()
-            data = response.json()
-            
-            if data.get("code") == 2000 and "data" in data and "students" in data["data"]:
-                students = data["data"]["students"]
-                if students and len(students) > 0:
-                    # 获取第一个学生的ID（因为按id_sort=desc排序，第一个就是最大的）
-                    return students[0]["id"]
-            
-            logging.warning("无法从API获取学生ID")
-            return 0
+        # 按ID降序只取第一页的 PAGE_SIZE 条，无需下载并解析完整的学生列表
+        response = await client.get(STUDENTS_LIST_API_URL, params={"id_sort": "desc", "page_size": PAGE_SIZE})
+        response.raise_for_status()
+        data = loads_json(response.content)
+        
+        if data.get("code") == 2000 and "data" in data and "students" in data["data"]:
+            students = data["data"]["students"]
+            if students and len(students) > 0:
+                # 获取第一个学生的ID（因为按id_sort=desc排序，第一个就是最大的）
+                return students[0]["id"]
+        
+        logging.warning("无法从API获取学生ID")
+        return 0
     except Exception as e:
         logging.error(f"获取最新学生ID失败: {e}")
         return 0
 
 # 从API获取最新的Spine ID
-async def get_final_spine_id() -> int:
+async def get_final_spine_id(client: httpx.AsyncClient) -> int:
     """从API获取最新的Spine ID（最大的ID）"""
     try:
-        async with httpx.AsyncClient() as client:
-            # 第一步：获取最大页数
-            response = await client.get(SPINES_LIST_API_URL, params={"page": 1}, timeout=10.0)
-            response.raise_for_status()
-            data = response.json()
+        # 第一步：获取最大页数
+        response = await client.get(SPINES_LIST_API_URL, params={"page": 1})
+        response.raise_for_status()
+        data = loads_json(response.content)
+        
+        if data.get("code") == 2000 and "data" in data and "max_page" in data["data"]:
+            max_page = data["data"]["max_page"]
             
-            if data.get("code") == 2000 and "data" in data and "max_page" in data["data"]:
-                max_page = data["data"]["max_page"]
-                
-                # 第二步：获取最后一页数据
-                response = await client.get(SPINES_LIST_API_URL, params={"page": max_page}, timeout=10.0)
-                response.raise_for_status()
-                data = response.json()
-                
-                if data.get("code") == 2000 and "data" in data and "spine" in data["data"]:
-                    spine_list = data["data"]["spine"]
-                    if spine_list and len(spine_list) > 0:
-                        # 返回最后一个spine的ID
-                        return spine_list[-1]["id"]
+            # 第二步：获取最后一页数据
+            response = await client.get(SPINES_LIST_API_URL, params={"page": max_page})
+            response.raise_for_status()
+            data = loads_json(response.content)
             
-            logging.warning("无法从API获取Spine ID")
-            return 0
+            if data.get("code") == 2000 and "data" in data and "spine" in data["data"]:
+                spine_list = data["data"]["spine"]
+                if spine_list and len(spine_list) > 0:
+                    # 返回最后一个spine的ID
+                    return spine_list[-1]["id"]
+        
+        logging.warning("无法从API获取Spine ID")
+        return 0
     except Exception as e:
         logging.error(f"获取最新Spine ID失败: {e}")
         return 0
@@ -79,14 +114,18 @@ STUDENT_ID_RANGE: range = range(1, FINAL_STUDENT_ID + 1)
 OUTPUT_DIR: Path = Path("output")
 OUTPUT_FILENAME: str = "students_data.csv"
 SKIPPED_FILENAME: str = "skipped_ids.csv"
+CSV_BUFFER_SIZE: int = 1 << 20  # CSV写入缓冲区大小（字节），减少底层 write 调用次数
 
 # 缓存目录配置
 CACHE_DIR: Path = Path("cache")
 
 # 请求配置
 MAX_CONCURRENT_REQUESTS: int = 3  # 最大并发请求数
+MAX_CONCURRENT_SPINE_REQUESTS: int | None = None  # Spine 请求的最大并发数，None 表示与学生请求相同
 REQUEST_DELAY_SECONDS: float = 2  # 两次请求之间的间隔（秒）
 PAGE_SIZE: int = 1  # API请求页大小，用于获取最新数据
+PROGRESS_LOG_INTERVAL: int = 100  # 每处理多少个学生输出一次进度
+HTTP2_ENABLED: bool = importlib.util.find_spec("h2") is not None  # 安装了 httpx[http2] 时启用 HTTP/2 多路复用
 
 # 运行模式配置
 TEST_MODE: bool = False  # 测试模式：True 表示只检测更新，不执行完整爬取
@@ -100,7 +139,7 @@ logging.getLogger("httpx").setLevel(logging.WARNING)
 
 # --- 数据结构定义 ---
 
-@dataclass
+@dataclass(slots=True)
 class StudentForm:
     """用于存储单个角色形态结构化数据的类"""
     file_id: str
@@ -116,7 +155,7 @@ class StudentForm:
     name_kr: str
 
 
-@dataclass
+@dataclass(slots=True)
 class SkippedRecord:
     """用于存储跳过的ID及其原因的类"""
     student_id: int = 0
@@ -132,18 +171,58 @@ class SkippedRecord:
 class CacheManager:
     """负责本地数据的缓存管理"""
 
+    # 清洗学生数据时使用的字段配置
+    _STRIPPED_MARKER: str = "(stripped)"
+    # 完全移除的字段（大文本 / 列表）
+    _KEYS_TO_REMOVE: tuple[str, ...] = (
+        'gallery', 'more',
+        'sd_model_image', 'avatar',
+        'recollection_lobby_image',
+        'introduction', 'introduction_cn',
+        'voice_play_icon', 'voice_pause_icon',
+        'source', 'contributor',
+    )
+    # 仅保留是否为空的信息，内容替换为标记的字段
+    _KEYS_TO_STRIP: tuple[str, ...] = ('voice', 'voice_cn', 'voice_kr')
+    # character_datas 内部的冗余字段
+    _CHAR_DATA_KEYS_TO_REMOVE: tuple[str, ...] = ('skill', 'cultivate_material', 'equipment', 'basic')
+    # weapons 内部嵌套的无用字段
+    _WEAPONS_KEYS_TO_REMOVE: tuple[str, ...] = ('icon', 'description', 'description_cn', 'info', 'skill')
+
     def __init__(self, base_dir: Path = CACHE_DIR):
         self.base_dir = base_dir
         self.students_dir = base_dir / "students"
         self.spines_dir = base_dir / "spines"
         self.state_file = base_dir / "state.json"
         self._ensure_dirs()
+        # 启动时各扫描一次缓存目录建立 ID 索引，未命中的 ID 无需再访问文件系统
+        self._student_ids: set[int] = self._scan_cached_ids(self.students_dir)
+        self._spine_ids: set[int] = self._scan_cached_ids(self.spines_dir)
 
     def _ensure_dirs(self):
         """确保缓存目录存在"""
         self.students_dir.mkdir(parents=True, exist_ok=True)
         self.spines_dir.mkdir(parents=True, exist_ok=True)
 
+    @property
+    def student_count(self) -> int:
+        """已缓存的学生文件数"""
+        return len(self._student_ids)
+
+    @property
+    def spine_count(self) -> int:
+        """已缓存的 Spine 文件数"""
+        return len(self._spine_ids)
+
+    @staticmethod
+    def _scan_cached_ids(directory: Path) -> set[int]:
+        """扫描缓存目录，返回已缓存的 ID 集合（文件名形如 123.json）"""
+        with os.scandir(directory) as entries:
+            return {
+                int(stem) for entry in entries
+                if entry.name.endswith(".json") and (stem := entry.name[:-5]).isdecimal()
+            }
+
     def _clean_student_data(self, json_data: dict[str, Any]) -> dict[str, Any]:
         """
         深度清洗学生数据，移除所有非ID/名称/Spine映射所需的字段。
@@ -155,56 +234,34 @@ class CacheManager:
         if not isinstance(data, dict):
             return json_data
 
-        STRIPPED_MARKER = "(stripped)"
-
-        # 1. 定义需要处理的字段
-        # keys_to_remove: 完全移除的字段
-        # keys_to_strip: 需要清洗的字段
-        keys_to_remove = [
-            # 大文本 / 列表
-            'gallery', 'more', 
-            'sd_model_image', 'avatar',
-            'recollection_lobby_image',
-            'introduction', 'introduction_cn',
-            'voice_play_icon', 'voice_pause_icon',
-            'source', 'contributor'
-        ]
-
-        keys_to_strip = ['voice', 'voice_cn', 'voice_kr']
-        
-        # 统一处理：先检查移除，再检查标记
-        for key in keys_to_remove + keys_to_strip:
-            if key in keys_to_remove:
-                data.pop(key, None)
-            elif key in keys_to_strip and key in data:
-                content = data[key]
-                # 如果列表存在且不为空，替换为标记
-                data[key] = [STRIPPED_MARKER] if content else []
+        # 1. 完全移除的字段
+        for key in self._KEYS_TO_REMOVE:
+            data.pop(key, None)
+
+        # 2. 需要清洗的字段：如果列表存在且不为空，替换为标记
+        for key in self._KEYS_TO_STRIP:
+            if key in data:
+                data[key] = [self._STRIPPED_MARKER] if data[key] else []
 
         # 清洗 character_datas
         if 'character_datas' in data:
             for char_data in data['character_datas']:
                 # 移除 character_datas 内部的冗余字段
-                sub_keys_to_remove = [
-                    'skill', 'cultivate_material', 'equipment', 
-                    'basic',
-                ]
-                for key in sub_keys_to_remove:
+                for key in self._CHAR_DATA_KEYS_TO_REMOVE:
                     char_data.pop(key, None)
                 
                 # 深度清洗 weapons 字段，移除嵌套的无用字段
-                if 'weapons' in char_data and isinstance(char_data['weapons'], dict):
-                    weapons_fields_to_remove = [
-                        'icon', 'description', 'description_cn', 
-                        'info', 'skill'
-                    ]
-                    for field in weapons_fields_to_remove:
-                        char_data['weapons'].pop(field, None)
+                weapons = char_data.get('weapons')
+                if isinstance(weapons, dict):
+                    for field in self._WEAPONS_KEYS_TO_REMOVE:
+                        weapons.pop(field, None)
 
         return json_data
 
     async def get_student(self, student_id: int) -> dict | None:
         """从缓存读取学生数据"""
+        if student_id not in self._student_ids:
+            return None
         file_path = self.students_dir / f"{student_id}.json"
         return await self._read_json(file_path)
 
@@ -214,9 +271,12 @@ class CacheManager:
         file_path = self.students_dir / f"{student_id}.json"
         if cleaned_data:
             await self._write_json(file_path, cleaned_data)
+            self._student_ids.add(student_id)
 
     async def get_spine(self, spine_id: int) -> dict | None:
         """从缓存读取 Spine 数据"""
+        if spine_id not in self._spine_ids:
+            return None
         file_path = self.spines_dir / f"{spine_id}.json"
         return await self._read_json(file_path)
 
@@ -224,6 +284,7 @@ class CacheManager:
         """保存 Spine 数据到缓存 (Spine 数据通常较小，不做额外清洗)"""
         file_path = self.spines_dir / f"{spine_id}.json"
         await self._write_json(file_path, data)
+        self._spine_ids.add(spine_id)
 
     async def get_state(self) -> dict:
         """读取状态文件"""
@@ -238,28 +299,29 @@ class CacheManager:
             "last_updated": None
         }
 
-    async def save_state(self, max_student_id: int, max_spine_id: int):
-        """保存状态文件"""
+    async def save_state(self, max_student_id: int, max_spine_id: int, fetch_error_count: int = 0):
+        """保存状态文件；fetch_error_count 为本次运行中可重试的获取失败次数"""
         state = {
             "max_student_id": max_student_id,
             "max_spine_id": max_spine_id,
+            "fetch_error_count": fetch_error_count,
             "last_updated": asyncio.get_event_loop().time()
         }
         await self._write_json(self.state_file, state)
 
     async def _read_json(self, path: Path) -> dict | None:
-        """异步读取 JSON 文件"""
-        if not path.exists():
-            return None
+        """异步读取 JSON 文件，文件不存在时返回 None"""
+        # 直接打开并处理 FileNotFoundError，命中时省去一次额外的 stat
         try:
             return await asyncio.to_thread(self._read_json_sync, path)
+        except FileNotFoundError:
+            return None
         except Exception as e:
             logging.warning(f"读取缓存失败 {path}: {e}")
             return None
 
     def _read_json_sync(self, path: Path) -> dict:
-        with open(path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return loads_json(path.read_bytes())
 
     async def _write_json(self, path: Path, data: dict):
         """异步写入紧凑格式 JSON"""
@@ -269,9 +331,7 @@ class CacheManager:
             logging.error(f"写入缓存失败 {path}: {e}")
 
     def _write_json_sync(self, path: Path, data: dict):
-        with open(path, 'w', encoding='utf-8') as f:
-            # 使用 separators 生成紧凑的 JSON (无多余空格)
-            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        path.write_bytes(dumps_json(data))
 
 class Sentinel:
     """负责检查是否需要更新数据"""
@@ -295,20 +355,63 @@ class Sentinel:
         
         return need_update, remote_max_student_id, remote_max_spine_id
 
+def create_http_client(max_concurrent: int) -> httpx.AsyncClient:
+    """创建爬取用的共享 HTTP 客户端，连接池大小与并发数对齐以复用 keep-alive 连接"""
+    return httpx.AsyncClient(
+        headers={"User-Agent": "BA-characters-internal-id (https://github.com/Agent-0808/BA-characters-internal-id)"},
+        # 所有请求都发往同一主机，HTTP/2 可在单个连接上并发多个请求
+        http2=HTTP2_ENABLED,
+        # 空闲连接保留时间需长于请求间隔（-d），否则每次请求前连接都已过期，需要重新握手
+        limits=httpx.Limits(max_connections=max_concurrent, max_keepalive_connections=max_concurrent, keepalive_expiry=30.0),
+        # 连接池本身即是并发上限：池满时排队等待空闲连接，而不是触发 PoolTimeout
+        timeout=httpx.Timeout(10.0, pool=None),
+    )
+
+class RateLimiter:
+    """
+    按固定间隔放行请求的限速器（容量为 1 的令牌桶）。
+    只限制请求的发起时刻，等待期间不占用任何并发槽位。
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._next_time = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """等待直到允许发起下一个请求"""
+        if self.interval <= 0:
+            return
+        # 持锁等待，保证等待者按到达顺序依次放行
+        async with self._lock:
+            now = asyncio.get_running_loop().time()
+            if (wait := self._next_time - now) > 0:
+                await asyncio.sleep(wait)
+                now = self._next_time
+            self._next_time = now + self.interval
+
 class APIClient:
     """负责处理所有网络请求及缓存管理的客户端"""
 
-    def __init__(self, client: httpx.AsyncClient, cache_manager: CacheManager):
+    def __init__(self, client: httpx.AsyncClient, cache_manager: CacheManager, rate_limiter: RateLimiter | None = None, max_concurrent_spine: int = MAX_CONCURRENT_REQUESTS):
         self.client = client
         self.cache = cache_manager
+        # 学生数据请求的限速器，默认不限速
+        self.rate_limiter = rate_limiter or RateLimiter(0.0)
+        # Spine 请求的并发上限：一个学生可能有大量 Spine，
+        # 启用 HTTP/2 时单个连接即可承载任意多个并发流，连接池上限无法约束同时发出的请求数
+        # 学生请求的并发由 Crawler 的工作协程数决定，两者可分别调节
+        self._spine_semaphore = asyncio.Semaphore(max_concurrent_spine)
         
         # 统计 API 请求次数
         self.student_req_count: int = 0
         self.spine_req_count: int = 0
+        # 本次运行中可重试的获取失败次数（网络错误/HTTP错误/未知错误），写入状态文件供下次运行判断
+        self.fetch_error_count: int = 0
 
-        self.client.headers.update({
-            "User-Agent": "BA-characters-internal-id (https://github.com/Agent-0808/BA-characters-internal-id)"
-        })
+        # 进行中的 Spine 获取任务，并发请求同一 spine_id 时直接复用；
+        # 任务完成即移除，已获取的数据由磁盘缓存索引提供，失败的请求下次调用时重新尝试
+        self._spine_tasks: dict[int, asyncio.Task[tuple[dict[str, Any] | None, str | None]]] = {}
 
     async def fetch_student_data(self, student_id: int, force_refresh: bool = False) -> tuple[dict | None, str | None, bool]:
         """
@@ -320,15 +423,16 @@ class APIClient:
             # 记录请求计数
             self.student_req_count += 1
             
-            url = CHAR_API_BASE_URL.format(student_id=student_id)
+            url = CHAR_API_BASE_URL % student_id
             try:
-                response = await self.client.get(url, timeout=10.0)
+                await self.rate_limiter.acquire()
+                response = await self.client.get(url)
                 if response.status_code == 404:
                     # 未找到
                     return None, "未找到 (404)", False
                 response.raise_for_status()
                 
-                json_data = response.json()
+                json_data = loads_json(response.content)
                 
                 # 成功获取后，保存到缓存
                 if json_data and json_data.get('code') == 2000:
@@ -337,14 +441,16 @@ class APIClient:
                 # 返回 False 表示来自 API 请求
                 return json_data, None, False
             except httpx.RequestError as e:
+                self.fetch_error_count += 1
                 return None, f"网络错误: {e}", False
             except Exception as e:
+                self.fetch_error_count += 1
                 logging.error(f"处理 ID {student_id} 时发生未知错误: {e}")
                 return None, f"未知错误: {e}", False
         
         # 2. 尝试从缓存获取
         if cached_data := await self.cache.get_student(student_id):
-            logging.debug(f"ID {student_id}: 命中缓存")
+            logging.debug("ID %s: 命中缓存", student_id)
             # 返回 True 表示命中缓存
             return cached_data, None, True
 
@@ -352,15 +458,16 @@ class APIClient:
         # 记录请求计数
         self.student_req_count += 1
         
-        url = CHAR_API_BASE_URL.format(student_id=student_id)
+        url = CHAR_API_BASE_URL % student_id
         try:
-            response = await self.client.get(url, timeout=10.0)
+            await self.rate_limiter.acquire()
+            response = await self.client.get(url)
             if response.status_code == 404:
                 # 未找到，未命中缓存
                 return None, "未找到 (404)", False
             response.raise_for_status()
             
-            json_data = response.json()
+            json_data = loads_json(response.content)
             
             # 4. 成功获取后，保存到缓存
             if json_data and json_data.get('code') == 2000:
@@ -370,16 +477,26 @@ class APIClient:
             return json_data, None, False
 
         except httpx.RequestError as e:
+            self.fetch_error_count += 1
             return None, f"网络错误: {e}", False
         except Exception as e:
+            self.fetch_error_count += 1
             logging.error(f"处理 ID {student_id} 时发生未知错误: {e}")
             return None, f"未知错误: {e}", False
 
     async def fetch_spine_data(self, spine_id: int) -> tuple[dict[str, Any] | None, str | None]:
         """
         根据 spine_id 获取 spine 数据（优先查缓存）。
+        同一 spine_id 的并发调用共享同一个进行中任务的结果。
         注意：此函数暂不需要返回是否命中缓存，因为并发获取时不由它控制主延迟。
         """
+        if (task := self._spine_tasks.get(spine_id)) is None:
+            task = self._spine_tasks[spine_id] = asyncio.create_task(self._fetch_spine_data(spine_id))
+            task.add_done_callback(lambda _: self._spine_tasks.pop(spine_id, None))
+        return await task
+
+    async def _fetch_spine_data(self, spine_id: int) -> tuple[dict[str, Any] | None, str | None]:
+        """实际获取 spine 数据（优先查缓存）"""
         # 1. 尝试从缓存获取
         if cached_data := await self.cache.get_spine(spine_id):
             if isinstance(cached_data, dict) and 'data' in cached_data:
@@ -390,11 +507,15 @@ class APIClient:
         # 记录请求计数
         self.spine_req_count += 1
 
-        url = SPINE_API_BASE_URL.format(spine_id=spine_id)
+        url = SPINE_API_BASE_URL % spine_id
         try:
-            response = await self.client.get(url, timeout=10.0)
+            async with self._spine_semaphore:
+                response = await self.client.get(url)
+            if response.status_code == 404:
+                # 与学生数据一致，常见的 404 直接返回，不经过异常构造与捕获
+                return None, "未找到 (404)"
             response.raise_for_status()
-            json_response = response.json()
+            json_response = loads_json(response.content)
             
             if isinstance(json_response, dict) and 'data' in json_response:
                 # 3. 成功获取后，保存完整响应到缓存
@@ -404,13 +525,14 @@ class APIClient:
             logging.warning(f"Spine ID {spine_id} 的响应格式无效: {json_response}")
             return None, "响应格式无效"
         except httpx.HTTPStatusError as e:
-            if e.response.status_code == 404:
-                return None, "未找到 (404)"
+            self.fetch_error_count += 1
             return None, f"HTTP错误: {e.response.status_code}"
         except httpx.RequestError as e:
+            self.fetch_error_count += 1
             logging.warning(f"请求 Spine ID {spine_id} 时网络错误: {e}")
             return None, f"网络错误: {e}"
         except Exception as e:
+            self.fetch_error_count += 1
             logging.error(f"处理 Spine ID {spine_id} 时发生未知错误: {e}")
             return None, f"未知错误: {e}"
 
@@ -431,6 +553,56 @@ class DataParser:
         "kr": ("family_name_kr", "given_name_kr", "", False), # KR 不包含皮肤
     }
 
+    # 标准文件ID格式 (CH/NP + 4位数字)，预编译以避免每次调用时查询 re 模块的内部缓存
+    # 字母大小写直接写入字符类，而非 re.IGNORECASE，匹配时无需逐字符做大小写折叠
+    _FILE_ID_PATTERN: re.Pattern[str] = re.compile(r"(?:[Cc][Hh]|[Nn][Pp])\d{4}")
+
+    # 接受的 Spine 类型
+    _SPINE_ACCEPT_TYPES: tuple[str, ...] = ("spr",)
+    # 名称中包含以下关键词的 Spine 将被跳过
+    _SPINE_KEYWORDS_TO_SKIP: tuple[str, ...] = ("toschool", "minori", "ui_raidboss")
+    # 需要跳过的 Spine 名称后缀
+    _SPINE_SUFFIXES_TO_SKIP: tuple[str, ...] = (
+        "_cn", "_steam", "_glitch_spr", "_cbt", "_halofix", "spr-2", "_old"
+    )
+
+    # Spine 备注中需要直接删除的单字 ("旧"/"新")
+    _OLD_NEW_TABLE: dict[int, None] = str.maketrans("", "", "旧新")
+
+    # Spine 备注的正则清洗规则，均在类加载时预编译一次，按顺序依次删除
+    _REMARK_REMOVAL_PATTERNS: tuple[re.Pattern[str], ...] = tuple(re.compile(p) for p in (
+        # 立绘类关键词：必须分三次依次删除，前一次删除后拼接出的新关键词（如 "立初始立绘绘"）需由后续规则继续清除
+        r"初始立绘",
+        r"立绘",
+        r"差分",
+
+        # 强力清除：只要括号里包含类似年份或日期的数字结构，直接删掉整个括号
+        # 匹配：括号 -> 非括号内容 -> 2到4位数字接"年"或"." -> 非括号内容 -> 括号
+        # 这能搞定 (23.11.08之前), (2023年1月前)
+        r"[\(（][^\)）]*?\d{2,4}[年\.][^\)）]*?[\)）]",
+
+        # 清除裸露的日期串，并强制匹配后面的方位词
+        # 匹配：数字 -> 年/. -> 数字 -> [月/.] -> [日] -> [空格] -> [之前/之后/前/后/更新/版本修改]
+        r"\d{2,4}[年\.-]\d{1,2}[月\.-]\d{0,2}日?\s*(?:之?[前后]|更新|版本修改)?",
+
+        # 清除特定的状态词
+        r"[\(（](?:已)?更新至实装[\)）]",
+        r"修正版?",
+        r"更新",
+        r"(?i)\b(old|new|fixed|ver\.?\d*)\b",
+    ))
+    # 空括号
+    _EMPTY_BRACKETS_PATTERN: re.Pattern[str] = re.compile(r"[\(（][\)）]")
+    # 双逗号
+    _DOUBLE_COMMA_PATTERN: re.Pattern[str] = re.compile(r"[,，]\s*[,，]")
+    # 括号内容，用于改为逗号分隔
+    _BRACKET_CONTENT_PATTERN: re.Pattern[str] = re.compile(r"[\(（]\s*([^)）]+?)\s*[\)）]")
+    # 特定替换规则：(模式, 替换文本)
+    _REMARK_REPLACEMENT_RULES: tuple[tuple[re.Pattern[str], str], ...] = (
+        (re.compile(r"礼服(?:日奈|亚子)"), "礼服"),
+        (re.compile("西服"), "西装"),
+    )
+
     # Student ID / 整体数据层面的处理 (最顶层验证与基础工具)
 
     def _validate_and_get_skip_reason(self, char_data: dict | None) -> str | None:
@@ -452,33 +624,36 @@ class DataParser:
 
         return None
 
-    def _build_name(self, family: str | None, given: str | None) -> str:
-        """基础工具：根据姓和名构建全名"""
-        family_name = family or ""
-        given_name = given or ""
-        if family_name:
-            return f"{family_name} {given_name}".strip()
-        return given_name
-
     # File ID 层面的处理 (标识符标准化)
 
-    def _normalize_file_id(self, file_id: str) -> str:
+    @staticmethod
+    @functools.lru_cache(maxsize=4096)
+    def _normalize_file_id(file_id: str) -> str:
         """
         标准化文件ID格式：
         - 优先提取标准的 CHxxxx / NPxxxx 格式
         - 移除 new_, old_ 前缀和 _spr 等后缀
+        纯函数，结果按输入缓存（同一 Spine 名称在多个学生/多个 Spine 间会重复出现）
         """
+        # 0. 快速路径：以标准格式开头（如 ch0145_spr、CH0145）时直接截取，无需走正则
+        #    正则 search 的最左匹配此时必然就是前 6 个字符，结果一致
+        if len(file_id) >= 6 and file_id[:2].upper() in ("CH", "NP") and file_id[2:6].isdecimal():
+            return file_id[:6].upper()
+
         # 1. 尝试直接提取标准格式 (CH/NP + 4位数字)
-        if match := re.search(r"(CH|NP)\d{4}", file_id, re.IGNORECASE):
+        if match := DataParser._FILE_ID_PATTERN.search(file_id):
             return match.group(0).upper()
 
         # 2. 否则手动清洗
+        # 前缀比较只需小写一次，剥离时同步裁剪小写副本
         cleaned_id = file_id.strip()
-        for prefix in ['J_', 'new_', 'old_']:
-            if cleaned_id.lower().startswith(prefix.lower()):
+        lowered_id = cleaned_id.lower()
+        for prefix in ('j_', 'new_', 'old_'):
+            if lowered_id.startswith(prefix):
                 cleaned_id = cleaned_id[len(prefix):]
+                lowered_id = lowered_id[len(prefix):]
 
-        for suffix in ['_spr', '_spr_update']:
+        for suffix in ('_spr', '_spr_update'):
             if cleaned_id.endswith(suffix):
                 cleaned_id = cleaned_id.removesuffix(suffix)
             
@@ -493,68 +668,61 @@ class DataParser:
         if not spine_item or not (name := spine_item.get("name")):
             return "缺少名称或数据无效"
 
-        name_lower = name.lower()
-
-        # 只接受spr类型
-        ACCEPT_TYPES = ["spr"]
-        if (type_ := spine_item.get("type")) not in ACCEPT_TYPES:
+        # 只接受spr类型（先做开销最小的类型判断，被跳过的类型无需再处理名称）
+        if (type_ := spine_item.get("type")) not in self._SPINE_ACCEPT_TYPES:
             return f"类型 ({type_})"
+
+        name_lower = name.lower()
         
         # 跳过包含特定关键词的形态
-        SPINE_KEYWORDS_TO_SKIP: list[str] = ["toschool", "minori", "ui_raidboss"]
-        for keyword in SPINE_KEYWORDS_TO_SKIP:
+        for keyword in self._SPINE_KEYWORDS_TO_SKIP:
             if keyword in name_lower:
                 return f"包含 ({keyword})"
 
-        # 跳过特定后缀的形态
-        SPINE_SUFFIXES_TO_SKIP: list[str] = [
-            "_cn", "_steam", "_glitch_spr", "_cbt", "_halofix", "spr-2", "_old"
-        ]
-        for suffix in SPINE_SUFFIXES_TO_SKIP:
-            if name_lower.endswith(suffix):
-                return f"后缀 ({suffix.removeprefix('_')})"
+        # 跳过特定后缀的形态（str.endswith 接受元组，一次调用即可完成全部检查）
+        if name_lower.endswith(self._SPINE_SUFFIXES_TO_SKIP):
+            # 仅在命中时才找出具体是哪个后缀，用于记录原因
+            suffix = next(s for s in self._SPINE_SUFFIXES_TO_SKIP if name_lower.endswith(s))
+            return f"后缀 ({suffix.removeprefix('_')})"
 
         return None
 
     def _process_spine_remark(self, remark: str | None, base_skin: str | None, name: str | None = None) -> str:
         """
-        处理 Spine 备注信息（核心正则清洗逻辑）
+        处理 Spine 备注信息：清洗后去掉与基础皮肤名或角色名重复的结果
         """
         if not remark:
             return ""
 
-        processed = remark
+        processed = self._clean_spine_remark(remark)
 
-        # 正则清洗规则列表
-        patterns = [
-            r"初始立绘",
-            r"立绘",
-            r"差分",
-            
-            # 强力清除：只要括号里包含类似年份或日期的数字结构，直接删掉整个括号
-            # 匹配：括号 -> 非括号内容 -> 2到4位数字接"年"或"." -> 非括号内容 -> 括号
-            # 这能搞定 (23.11.08之前), (2023年1月前)
-            r"[\(（][^\)）]*?\d{2,4}[年\.][^\)）]*?[\)）]",
+        # 如果处理后的备注与该角色的基础皮肤名一致，则不重复添加
+        if base_skin and processed == base_skin:
+            return ""
+        # 如果处理后的备注与角色名相同，也不添加
+        if name and processed == name:
+            return ""
 
-            # 清除裸露的日期串，并强制匹配后面的方位词
-            # 匹配：数字 -> 年/. -> 数字 -> [月/.] -> [日] -> [空格] -> [之前/之后/前/后/更新/版本修改]
-            r"\d{2,4}[年\.-]\d{1,2}[月\.-]\d{0,2}日?\s*(?:之?[前后]|更新|版本修改)?",
+        return processed
 
-            # 清除特定的状态词
-            r"[\(（](?:已)?更新至实装[\)）]",
-            r"修正版?",
-            r"更新",
-            r"(?i)\b(old|new|fixed|ver\.?\d*)\b",
+    @staticmethod
+    @functools.lru_cache(maxsize=4096)
+    def _clean_spine_remark(remark: str) -> str:
+        """
+        Spine 备注的核心正则清洗逻辑。
+        只依赖备注本身，与语言和角色无关，结果按备注缓存（同一备注在各语言及多个学生间重复出现）
+        """
+        processed = remark
 
-            # 删除 "旧" 和 "新"
-            r"[旧新]",
+        # 依次应用预编译的删除规则
+        for pattern in DataParser._REMARK_REMOVAL_PATTERNS:
+            processed = pattern.sub("", processed)
 
-            # 删除空括号
-            r"[\(（][\)）]",
-        ]
+        # 删除 "旧" 和 "新"（纯单字删除，用 str.translate 一次遍历完成）
+        processed = processed.translate(DataParser._OLD_NEW_TABLE)
 
-        for pat in patterns:
-            processed = re.sub(pat, "", processed)
+        # 删除空括号
+        processed = DataParser._EMPTY_BRACKETS_PATTERN.sub("", processed)
 
         # 后处理：清理因删除单词留下的标点符号
         processed = processed.replace("()", "").replace("（）", "").strip()
@@ -562,36 +730,46 @@ class DataParser:
         # 移除开头和结尾的逗号/空格
         processed = processed.strip(",， ")
         # 移除中间可能出现的双逗号
-        processed = re.sub(r"[,，]\s*[,，]", ",", processed)
+        processed = DataParser._DOUBLE_COMMA_PATTERN.sub(",", processed)
         # 括号改为逗号分隔，例如"冬装（无围巾）"→"冬装,无围巾"
-        processed = re.sub(r"[\(（]\s*([^)）]+?)\s*[\)）]", r",\1", processed)
+        processed = DataParser._BRACKET_CONTENT_PATTERN.sub(r",\1", processed)
         processed = processed.strip(",，")
         
-        # 特定替换规则列表
-        replacement_rules = [
-            (r"礼服(?:日奈|亚子)", "礼服"),
-            ("西服", "西装"),
-        ]
-        
-        # 应用替换规则
-        for pattern, replacement in replacement_rules:
-            processed = re.sub(pattern, replacement, processed)
-
-        # 如果处理后的备注与该角色的基础皮肤名一致，则不重复添加
-        if base_skin and processed == base_skin:
-            return ""
-        # 如果处理后的备注与角色名相同，也不添加
-        if name and processed == name:
-            return ""
+        # 应用特定替换规则
+        for pattern, replacement in DataParser._REMARK_REPLACEMENT_RULES:
+            processed = pattern.sub(replacement, processed)
 
         return processed
 
-    def _build_formatted_name(self, data: dict, lang_key: str, spine_remark: str) -> str:
-        """根据语言配置构建最终名称"""
-        fam_key, giv_key, skin_key, include_skin = self._LANG_CONFIG[lang_key]
-        
-        # 构建基础姓名
-        base_name = self._build_name(data.get(fam_key), data.get(giv_key))
+    def _build_base_names(self, data: dict) -> dict[str, str]:
+        """
+        按语言配置构建各语言的基础姓名（不含皮肤），每个学生只需计算一次。
+        有姓时为 "姓 名"，否则仅为名。
+        """
+        base_names: dict[str, str] = {}
+        for lang_key, (fam_key, giv_key, _, _) in self._LANG_CONFIG.items():
+            family_name = data.get(fam_key) or ""
+            given_name = data.get(giv_key) or ""
+            base_names[lang_key] = f"{family_name} {given_name}".strip() if family_name else given_name
+        return base_names
+
+    def _build_base_skins(self, data: dict) -> dict[str, str]:
+        """按语言配置读取各语言的基础皮肤名称，每个学生只需读取一次；不附加皮肤的语言为空字符串"""
+        return {
+            lang_key: (data.get(skin_key) or "") if include_skin else ""
+            for lang_key, (_, _, skin_key, include_skin) in self._LANG_CONFIG.items()
+        }
+
+    @staticmethod
+    def _join_skin(base_skin: str, processed_remark: str) -> str:
+        """用逗号拼接皮肤名称与处理后的备注，忽略其中为空的部分"""
+        if base_skin and processed_remark:
+            return f"{base_skin},{processed_remark}"
+        return base_skin or processed_remark
+
+    def _build_formatted_name(self, lang_key: str, spine_remark: str, base_name: str, base_skin: str) -> str:
+        """根据语言配置和预先构建的基础姓名、基础皮肤名称构建最终名称"""
+        include_skin = self._LANG_CONFIG[lang_key][3]
         
         # 如果连名字都没有（比如CN名字为空），直接返回空字符串
         if not base_name:
@@ -602,16 +780,8 @@ class DataParser:
             return base_name
 
         # 处理皮肤名称
-        base_skin = data.get(skin_key) or ""
         processed_remark = self._process_spine_remark(spine_remark, base_skin, base_name)
-        
-        skin_parts = []
-        if base_skin:
-            skin_parts.append(base_skin)
-        if processed_remark:
-            skin_parts.append(processed_remark)
-        
-        final_skin = ",".join(skin_parts)
+        final_skin = self._join_skin(base_skin, processed_remark)
 
         if final_skin:
             return f"{base_name}（{final_skin}）"
@@ -637,14 +807,25 @@ class DataParser:
         skipped_spines: list[SkippedRecord] = []
 
         # 预先计算基础名称，用于 SkippedRecord
-        base_name_jp = self._build_name(data.get("family_name_jp"), data.get("given_name_jp"))
-        base_name_en = self._build_name(data.get("family_name_en"), data.get("given_name_en"))
-        default_name = self._build_name(data.get("family_name"), data.get("given_name"))
+        base_names = self._build_base_names(data)
+        base_name_jp = base_names["jp"]
+        base_name_en = base_names["en"]
+        default_name = base_names["name"]
+        base_skins = self._build_base_skins(data)
+        base_skin = base_skins["full_name"]
+        school = data.get("school", "")
+        # 备注 -> (各语言名称, skin_name) 的缓存
+        names_by_remark: dict[str | None, tuple[dict[str, str], str]] = {}
+
+        # 循环内频繁调用的方法提前绑定到局部变量
+        get_skip_reason = self._get_spine_skip_reason
+        normalize_file_id = self._normalize_file_id
+        add_skipped = skipped_spines.append
 
         for spine_item in spine_data:
             # 3.1 检查 Spine 是否跳过
-            if skip_reason := self._get_spine_skip_reason(spine_item):
-                skipped_spines.append(SkippedRecord(
+            if skip_reason := get_skip_reason(spine_item):
+                add_skipped(SkippedRecord(
                     student_id=kivo_wiki_id,
                     spine_id=spine_item.get("id"),
                     reason=skip_reason,
@@ -653,13 +834,13 @@ class DataParser:
                     name=default_name, 
                     name_jp=base_name_jp, 
                     name_en=base_name_en, 
-                    school=data.get("school", "")
+                    school=school
                 ))
                 continue
 
             spine_name_raw = spine_item["name"]
             # 处理 File ID
-            file_id = self._normalize_file_id(spine_name_raw)
+            file_id = normalize_file_id(spine_name_raw)
             
             if not file_id:
                 continue
@@ -668,18 +849,27 @@ class DataParser:
             spine_id = spine_item.get("id")
             spine_remark = spine_item.get("remark", "")
 
-            # 3.3 处理各种语言的名称 (内部调用 _process_spine_remark)
-            names = {
-                key: self._build_formatted_name(data, key, spine_remark)
-                for key in self._LANG_CONFIG
-            }
+            # --- 去重与合并逻辑 ---
+            # 简单的“后者优先”策略：假设 spine_id 越大代表版本越新
+            # 这样新版（ID大）会覆盖旧版（ID小）；会被丢弃的旧版无需构建名称和记录
+            existing_form = forms_map.get(file_id)
+            if existing_form is not None and (spine_id or 0) <= (existing_form.spine_id or 0):
+                continue
 
-            # 单独计算 skin_name 字段
-            base_skin = data.get("skin") or ""
-            processed_remark = self._process_spine_remark(spine_remark, base_skin, default_name)
-            # 使用推导式构建列表，自动过滤空字符串
-            skin_parts = [s for s in [base_skin, processed_remark] if s]
-            final_skin_str = ",".join(skin_parts)
+            # 同一学生的多个 Spine 常带有相同备注（如空备注），名称只依赖备注，按备注缓存即可
+            if (cached_names := names_by_remark.get(spine_remark)) is None:
+                # 3.3 处理各种语言的名称 (内部调用 _process_spine_remark)
+                names = {
+                    key: self._build_formatted_name(key, spine_remark, base_name, base_skins[key])
+                    for key, base_name in base_names.items()
+                }
+
+                # 单独计算 skin_name 字段
+                processed_remark = self._process_spine_remark(spine_remark, base_skin, default_name)
+                final_skin_str = self._join_skin(base_skin, processed_remark)
+
+                cached_names = names_by_remark[spine_remark] = (names, final_skin_str)
+            names, final_skin_str = cached_names
 
             form = StudentForm(
                 file_id=file_id,
@@ -694,16 +884,7 @@ class DataParser:
                 name_en=names["en"],
                 name_kr=names["kr"]
             )
-
-            # --- 去重与合并逻辑 ---
-            if file_id in forms_map:
-                existing_form = forms_map[file_id]
-                # 简单的“后者优先”策略：假设 spine_id 越大代表版本越新
-                # 这样新版（ID大）会覆盖旧版（ID小）
-                if (spine_id or 0) > (existing_form.spine_id or 0):
-                    forms_map[file_id] = form
-            else:
-                forms_map[file_id] = form
+            forms_map[file_id] = form
 
         results = list(forms_map.values())
 
@@ -715,54 +896,108 @@ class DataParser:
 # --- 文件输出模块 ---
 
 class CsvWriter:
-    """负责将处理好的数据写入CSV文件"""
+    """
+    负责将处理好的数据增量写入CSV文件。
+    先写入临时文件（首次写入时才创建），关闭时再原子替换正式文件，
+    运行中途失败时原有输出文件保持不变。
+    """
 
-    def __init__(self, filename: str):
+    def __init__(self, filename: str, record_type: type, label: str):
         self.filename = filename
+        self.label = label
+        # 获取dataclass的字段名作为表头，并用 attrgetter 构建行
+        # （astuple 会对每个字段做递归深拷贝，对纯标量记录是多余开销）
+        self.header = [f.name for f in fields(record_type)]
+        self._row_getter = attrgetter(*self.header)
+        self._file = None
+        self._writer = None
+        self._temp_path: Path = OUTPUT_DIR / f"{filename}.tmp"
+        self._failed = False
+        self.count = 0
         # 确保输出目录存在
         OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
+    @staticmethod
+    def outputs_up_to_date(filenames: tuple[str, ...], reference: Path) -> bool:
+        """所有输出文件均存在且修改时间不早于参考文件（状态文件）时返回 True"""
+        try:
+            reference_mtime = reference.stat().st_mtime
+            return all((OUTPUT_DIR / filename).stat().st_mtime >= reference_mtime for filename in filenames)
+        except FileNotFoundError:
+            return False
+
+    def __enter__(self) -> "CsvWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # 运行中途出现异常时丢弃未完成的临时文件，不覆盖原有输出
+        self.close(commit=exc_type is None)
+
     def _get_alternative_filename(self, original_filename: str) -> str:
         """生成备用文件名"""
         base, ext = original_filename.rsplit('.', 1)
         return f"{base}_backup.{ext}"
 
-    def write(self, data: list[StudentForm]):
-        """将StudentForm列表写入CSV文件"""
-        if not data:
-            logging.warning("没有可供写入的数据。")
+    def _open(self) -> bool:
+        """打开临时输出文件并写入表头"""
+        try:
+            self._file = open(self._temp_path, 'w', newline='', encoding='utf-8', buffering=CSV_BUFFER_SIZE)
+            # 手动写入 BOM（供 Excel 识别编码），之后按普通 UTF-8 编码，效果与 utf-8-sig 相同
+            self._file.write('\ufeff')
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(self.header)
+        except OSError as e:
+            logging.error(f"创建临时文件 {self._temp_path} 时发生错误: {e}")
+            self._abort()
+            return False
+        logging.info(f"开始将{self.label}写入到临时文件 {self._temp_path}...")
+        return True
+
+    def _abort(self):
+        """写入失败：停止后续写入，删除临时文件，原有输出文件保持不变"""
+        logging.error(f"{self.label}未能保存，保留原有输出文件。")
+        self._failed = True
+        self._writer = None
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+        self._temp_path.unlink(missing_ok=True)
+
+    def write(self, data: list[Any]):
+        """追加写入一批dataclass记录；写入出错时记录日志并停止写入，不中断爬取"""
+        if not data or self._failed:
             return
+        if self._writer is None and not self._open():
+            return
+        try:
+            self._writer.writerows(map(self._row_getter, data))
+        except OSError as e:
+            logging.error(f"写入临时文件 {self._temp_path} 时发生错误: {e}")
+            self._abort()
+            return
+        self.count += len(data)
 
-        # 构建完整路径
-        full_path = OUTPUT_DIR / self.filename
-        filenames_to_try = [full_path, OUTPUT_DIR / self._get_alternative_filename(self.filename)]
-
-        for filepath in filenames_to_try:
-            try:
-                logging.info(f"开始将 {len(data)} 条记录写入到 {filepath}...")
-                with open(filepath, 'w', newline='', encoding='utf-8-sig') as csvfile:
-                    # 获取dataclass的字段名作为表头
-                    header = [f.name for f in fields(StudentForm)]
-                    writer = csv.writer(csvfile)
-                    writer.writerow(header)
-                    # 使用推导式和astuple提高写入效率
-                    writer.writerows(astuple(form) for form in data)
-                logging.info(f"数据成功写入 {filepath}。")
-                return  # 成功写入，退出函数
-            except IOError as e:
-                if filepath == filenames_to_try[-1]:
-                    # 已经是最后一个文件名，仍然失败
-                    logging.error(f"写入文件 {filepath} 时发生错误: {e}")
-                    logging.error("所有尝试的文件名均失败，数据未能保存。")
-                else:
-                    # 还有备用文件名可以尝试
-                    logging.warning(f"写入文件 {filepath} 失败，可能是文件被占用，尝试使用备用文件名...")
-                    continue
+    def close(self, commit: bool = True):
+        """关闭临时文件；commit 为 True 时用其替换正式文件，失败时尝试备用文件名"""
+        if self._file is None:
+            if not self._failed:
+                logging.warning(f"没有可供写入的{self.label}。")
+            return
+        try:
+            self._file.close()
+        except OSError as e:
+            self._file = None
+            logging.error(f"写入临时文件 {self._temp_path} 时发生错误: {e}")
+            self._abort()
+            return
+        self._file = None
 
-    def write_skipped(self, data: list[SkippedRecord]):
-        """将SkippedRecord列表写入CSV文件"""
-        if not data:
-            logging.warning("没有可供写入的跳过记录。")
+        if not commit:
+            logging.warning(f"运行未正常完成，丢弃未完成的{self.label}，保留原有输出文件。")
+            self._temp_path.unlink(missing_ok=True)
             return
 
         # 构建完整路径
@@ -771,25 +1006,46 @@ class CsvWriter:
 
         for filepath in filenames_to_try:
             try:
-                logging.info(f"开始将 {len(data)} 条跳过记录写入到 {filepath}...")
-                with open(filepath, 'w', newline='', encoding='utf-8-sig') as csvfile:
-                    # 获取dataclass的字段名作为表头
-                    header = [f.name for f in fields(SkippedRecord)]
-                    writer = csv.writer(csvfile)
-                    writer.writerow(header)
-                    # 使用推导式和astuple提高写入效率
-                    writer.writerows(astuple(record) for record in data)
-                logging.info(f"跳过记录成功写入 {filepath}。")
-                return  # 成功写入，退出函数
-            except IOError as e:
+                # 同一目录内替换是原子操作，读者只会看到旧文件或完整的新文件
+                os.replace(self._temp_path, filepath)
+                logging.info(f"{self.count} 条{self.label}成功写入 {filepath}。")
+                return
+            except OSError as e:
                 if filepath == filenames_to_try[-1]:
                     # 已经是最后一个文件名，仍然失败
                     logging.error(f"写入文件 {filepath} 时发生错误: {e}")
-                    logging.error("所有尝试的文件名均失败，跳过记录未能保存。")
+                    logging.error(f"所有尝试的文件名均失败，{self.label}未能保存。")
+                    self._temp_path.unlink(missing_ok=True)
                 else:
                     # 还有备用文件名可以尝试
                     logging.warning(f"写入文件 {filepath} 失败，可能是文件被占用，尝试使用备用文件名...")
-                    continue
+
+
+class OrderedResultSink:
+    """
+    按学生ID顺序写出结果：
+    并发任务乱序完成，先完成的结果暂存，待其之前的ID全部到齐后再依次写入，
+    从而无需在内存中累积全部结果后再排序，输出顺序与按 (学生ID, file_id) 全量排序一致。
+    """
+
+    def __init__(self, student_ids: range, form_writer: CsvWriter, skipped_writer: CsvWriter):
+        self.form_writer = form_writer
+        self.skipped_writer = skipped_writer
+        self._pending: dict[int, tuple[list[StudentForm], list[SkippedRecord]]] = {}
+        self._id_iter = iter(student_ids)
+        self._next_id = next(self._id_iter, None)
+
+    def add(self, student_id: int, forms: list[StudentForm], skipped: list[SkippedRecord]):
+        """接收单个学生的结果，并写出所有已就绪的连续结果"""
+        self._pending[student_id] = (forms, skipped)
+        while self._next_id in self._pending:
+            forms, skipped = self._pending.pop(self._next_id)
+            # 同一学生内部：形态按 file_id 排序，跳过记录按 spine_id 排序
+            forms.sort(key=attrgetter("file_id"))
+            skipped.sort(key=lambda x: x.spine_id or -1)
+            self.form_writer.write(forms)
+            self.skipped_writer.write(skipped)
+            self._next_id = next(self._id_iter, None)
 
 
 # --- 主逻辑与执行 ---
@@ -798,328 +1054,249 @@ async def process_student_id(
     student_id: int,
     client: APIClient,
     parser: DataParser,
-    semaphore: asyncio.Semaphore,
-    delay: float,
     force_refresh: bool = False
 ) -> tuple[int, list[StudentForm], list[SkippedRecord]]:
     """
     获取、解析并处理单个学生ID的数据。
     """
-    async with semaphore:
-        all_skipped: list[SkippedRecord] = []
-        
-        # 获取数据，并得知来源是否为缓存
-        json_data, fetch_reason, from_cache = await client.fetch_student_data(student_id)
-        
-        # 如果强制刷新且数据来自缓存，则重新获取
-        if force_refresh and from_cache:
-            # 清除缓存，重新获取
-            logging.debug(f"ID {student_id}: 强制刷新，清除缓存并重新获取")
-            json_data, fetch_reason, from_cache = await client.fetch_student_data(student_id, force_refresh=True)
-        
-        # 如果数据不是来自缓存（即发起了网络请求），则执行延迟以礼貌对待 API
-        if not from_cache:
-            await asyncio.sleep(delay)
-
-        if not json_data:
-            # 在无法获取JSON数据时，创建一个包含基本信息的SkippedRecord
-            skipped = SkippedRecord(
-                student_id=student_id,
-                spine_id=None,
-                reason=fetch_reason or "未知网络原因",
-                spine_name=None, 
-                spine_remark=None,
-                name="", 
-                name_jp="", 
-                name_en="", 
-                school=""
-            )
-            return student_id, [], [skipped]
-
-        # 获取 spine 数据
-        spine_ids = json_data.get("data", {}).get("spine", [])
-        spine_tasks = [client.fetch_spine_data(sid) for sid in spine_ids if isinstance(sid, int)]
-        spine_results_raw = await asyncio.gather(*spine_tasks)
+    all_skipped: list[SkippedRecord] = []
+    
+    # 获取数据，并得知来源是否为缓存
+    json_data, fetch_reason, from_cache = await client.fetch_student_data(student_id)
+    
+    # 如果强制刷新且数据来自缓存，则重新获取
+    if force_refresh and from_cache:
+        # 清除缓存，重新获取
+        logging.debug("ID %s: 强制刷新，清除缓存并重新获取", student_id)
+        json_data, fetch_reason, from_cache = await client.fetch_student_data(student_id, force_refresh=True)
+    
+    if not json_data:
+        # 在无法获取JSON数据时，创建一个包含基本信息的SkippedRecord
+        skipped = SkippedRecord(
+            student_id=student_id,
+            spine_id=None,
+            reason=fetch_reason or "未知网络原因",
+            spine_name=None, 
+            spine_remark=None,
+            name="", 
+            name_jp="", 
+            name_en="", 
+            school=""
+        )
+        return student_id, [], [skipped]
+
+    # 获取 spine 数据；整个学生会被跳过时（如官方账号）无需请求其 Spine，由 parse 给出跳过原因
+    spine_results: list[dict[str, Any]] = []
+    if not parser._validate_and_get_skip_reason(json_data):
+        spine_ids = [sid for sid in json_data["data"].get("spine", []) if isinstance(sid, int)]
+        # 同一学生的 Spine 列表可能包含重复ID：每个ID只请求一次，再按原列表顺序展开结果
+        unique_spine_ids = list(dict.fromkeys(spine_ids))
+        spine_tasks = [client.fetch_spine_data(sid) for sid in unique_spine_ids]
+        fetched = dict(zip(unique_spine_ids, await asyncio.gather(*spine_tasks)))
         # 只提取成功获取的数据部分，忽略错误信息
-        spine_results = [data for data, error in spine_results_raw if data is not None]
-
-        forms, skipped_spines, student_skip_reason = parser.parse(json_data, student_id, spine_results)
-        all_skipped.extend(skipped_spines)
-
-        if student_skip_reason:
-            # 如果整个学生因规则被跳过，则从JSON数据中提取详细信息
-            data = json_data.get("data", {})
-            name = parser._build_name(data.get("family_name"), data.get("given_name")) or data.get("given_name_cn", "")
-            name_jp = parser._build_name(data.get("family_name_jp"), data.get("given_name_jp")) or ""
-            name_en = parser._build_name(data.get("family_name_en"), data.get("given_name_en")) or ""
-            school = data.get("school", "")
-
-            skipped = SkippedRecord(
-                student_id=student_id,
-                spine_id=None,
-                reason=student_skip_reason,
-                spine_name=None, 
-                spine_remark=None,
-                name=name,
-                name_jp=name_jp,
-                name_en=name_en,
-                school=school
-            )
-            all_skipped.append(skipped)
+        spine_results = [data for data, error in map(fetched.__getitem__, spine_ids) if data is not None]
+
+    forms, skipped_spines, student_skip_reason = parser.parse(json_data, student_id, spine_results)
+    all_skipped.extend(skipped_spines)
+
+    if student_skip_reason:
+        # 如果整个学生因规则被跳过，则从JSON数据中提取详细信息
+        data = json_data.get("data", {})
+        base_names = parser._build_base_names(data)
+        name = base_names["name"] or data.get("given_name_cn", "")
+        name_jp = base_names["jp"]
+        name_en = base_names["en"]
+        school = data.get("school", "")
+
+        skipped = SkippedRecord(
+            student_id=student_id,
+            spine_id=None,
+            reason=student_skip_reason,
+            spine_name=None, 
+            spine_remark=None,
+            name=name,
+            name_jp=name_jp,
+            name_en=name_en,
+            school=school
+        )
+        all_skipped.append(skipped)
 
-        return student_id, forms, all_skipped
+    return student_id, forms, all_skipped
 
 class Crawler:
     """核心爬虫工作流"""
     
-    def __init__(self, client: APIClient, parser: DataParser, cache_manager: CacheManager, max_concurrent: int, delay: float):
+    def __init__(self, client: APIClient, parser: DataParser, cache_manager: CacheManager, max_concurrent: int):
         self.client = client
         self.parser = parser
         self.cache_manager = cache_manager
         self.max_concurrent = max_concurrent
-        self.delay = delay
     
-    async def refresh_students(self, student_ids: list[int]) -> tuple[list[StudentForm], list[SkippedRecord]]:
-        """刷新所有学生索引"""
-        semaphore = asyncio.Semaphore(self.max_concurrent)
-        tasks = [
-            process_student_id(student_id, self.client, self.parser, semaphore, self.delay, force_refresh=True)
-            for student_id in student_ids
-        ]
-        
-        all_student_forms: list[StudentForm] = []
-        all_skipped_records: list[SkippedRecord] = []
-        
+    async def refresh_students(self, student_ids: range, sink: OrderedResultSink):
+        """刷新所有学生索引，结果在完成时写入 sink"""
         logging.info(f"开始刷新 {len(student_ids)} 个学生数据...")
-        processed_count = 0
-        total_count = len(student_ids)
-        
-        for future in asyncio.as_completed(tasks):
-            processed_count += 1
-            student_id, forms_list, newly_skipped_records = await future
-            
-            progress_prefix = f"[{processed_count}/{total_count}]"
-            
-            if forms_list:
-                # 成功提取到数据
-                file_ids_str = ", ".join(form.file_id for form in forms_list)
-                logging.info(f"{progress_prefix} ID: {student_id} -> 成功, File IDs: {file_ids_str}")
-                all_student_forms.extend(forms_list)
-            
-            if newly_skipped_records:
-                # 记录并打印跳过信息
-                for skipped in newly_skipped_records:
-                    if skipped.spine_id:
-                        logging.info(f"{progress_prefix} ID: {student_id} -> Spine ID {skipped.spine_id} 已跳过 ({skipped.reason})")
-                    else:
-                        logging.info(f"{progress_prefix} ID: {student_id} -> 已跳过 ({skipped.reason})")
-                all_skipped_records.extend(newly_skipped_records)
-        
-        return all_student_forms, all_skipped_records
+        await self._run_workers(student_ids, sink, force_refresh=True)
     
-    async def get_all_student_forms_from_cache(self, student_ids: list[int]) -> tuple[list[StudentForm], list[SkippedRecord]]:
-        """直接从缓存获取所有学生数据"""
-        semaphore = asyncio.Semaphore(self.max_concurrent)
-        tasks = [
-            process_student_id(student_id, self.client, self.parser, semaphore, self.delay)
-            for student_id in student_ids
-        ]
-        
-        all_student_forms: list[StudentForm] = []
-        all_skipped_records: list[SkippedRecord] = []
-        
+    async def get_all_student_forms_from_cache(self, student_ids: range, sink: OrderedResultSink):
+        """直接从缓存获取所有学生数据，结果在完成时写入 sink"""
         logging.info(f"开始从缓存读取 {len(student_ids)} 个学生数据...")
+        await self._run_workers(student_ids, sink)
+
+    async def _run_workers(self, student_ids: range, sink: OrderedResultSink, force_refresh: bool = False):
+        """
+        由固定数量的工作协程从共享迭代器中按序领取学生ID并处理。
+        工作协程数即并发上限，无需为每个ID预先创建任务再由信号量排队；
+        next() 期间不会让出事件循环，多个工作协程共用同一迭代器是安全的，ID 也无需预先入队。
+        """
+        id_iter = iter(student_ids)
+
         processed_count = 0
         total_count = len(student_ids)
+
+        async def worker():
+            nonlocal processed_count
+            for student_id in id_iter:
+                _, forms_list, newly_skipped_records = await process_student_id(
+                    student_id, self.client, self.parser, force_refresh=force_refresh
+                )
+                processed_count += 1
+                self._log_result(processed_count, total_count, student_id, forms_list, newly_skipped_records)
+                sink.add(student_id, forms_list, newly_skipped_records)
+                # 逐个学生的详情仅在 DEBUG 级别输出，默认只按固定间隔汇报进度
+                if processed_count % PROGRESS_LOG_INTERVAL == 0 or processed_count == total_count:
+                    logging.info(f"[{processed_count}/{total_count}] 已处理，最近完成的学生ID: {student_id}")
+
+        # 任一工作协程出现未处理的异常时，TaskGroup 会立即取消其余工作协程，避免继续发起无用请求
+        try:
+            async with asyncio.TaskGroup() as task_group:
+                for _ in range(min(self.max_concurrent, total_count)):
+                    task_group.create_task(worker())
+        except ExceptionGroup as group:
+            # TaskGroup 会把异常包装为 ExceptionGroup，这里取出首个原始异常重新抛出，保持原有的错误输出
+            raise group.exceptions[0] from None
+
+    @staticmethod
+    def _log_result(processed_count: int, total_count: int, student_id: int, forms_list: list[StudentForm], newly_skipped_records: list[SkippedRecord]):
+        """
+        以 DEBUG 级别打印单个学生的处理结果（成功的 File ID 与跳过原因同样记录在输出文件中）。
+        未启用 DEBUG 时直接返回，省去字符串拼接与格式化。
+        """
+        if not logging.getLogger().isEnabledFor(logging.DEBUG):
+            return
+
+        progress_prefix = f"[{processed_count}/{total_count}]"
+
+        if forms_list:
+            # 成功提取到数据
+            file_ids_str = ", ".join(form.file_id for form in forms_list)
+            logging.debug(f"{progress_prefix} ID: {student_id} -> 成功, File IDs: {file_ids_str}")
         
-        for future in asyncio.as_completed(tasks):
-            processed_count += 1
-            student_id, forms_list, newly_skipped_records = await future
-            
-            progress_prefix = f"[{processed_count}/{total_count}]"
-            
-            if forms_list:
-                # 成功提取到数据
-                file_ids_str = ", ".join(form.file_id for form in forms_list)
-                logging.info(f"{progress_prefix} ID: {student_id} -> 成功, File IDs: {file_ids_str}")
-                all_student_forms.extend(forms_list)
-            
-            if newly_skipped_records:
-                # 记录并打印跳过信息
-                for skipped in newly_skipped_records:
-                    if skipped.spine_id:
-                        logging.info(f"{progress_prefix} ID: {student_id} -> Spine ID {skipped.spine_id} 已跳过 ({skipped.reason})")
-                    else:
-                        logging.info(f"{progress_prefix} ID: {student_id} -> 已跳过 ({skipped.reason})")
-                all_skipped_records.extend(newly_skipped_records)
+        if newly_skipped_records:
+            # 记录并打印跳过信息
+            for skipped in newly_skipped_records:
+                if skipped.spine_id:
+                    logging.debug(f"{progress_prefix} ID: {student_id} -> Spine ID {skipped.spine_id} 已跳过 ({skipped.reason})")
+                else:
+                    logging.debug(f"{progress_prefix} ID: {student_id} -> 已跳过 ({skipped.reason})")
+
+async def startup(check_mode: bool = TEST_MODE, max_concurrent: int = MAX_CONCURRENT_REQUESTS, delay: float = REQUEST_DELAY_SECONDS, test_id: int | None = None, no_cache_overwrite: bool = False, rewrite_outputs: bool = False, max_concurrent_spine: int | None = MAX_CONCURRENT_SPINE_REQUESTS):
+    """程序启动函数，负责初始化配置"""
+    # 整个运行期间共用一个 HTTP 客户端，启动时的查询也复用其连接
+    # 连接池需同时容纳学生与 Spine 两类请求中并发较高的一方
+    async with create_http_client(max(max_concurrent, max_concurrent_spine or 0)) as http_client:
+        # 测试模式不需要获取全局最新 ID
+        if test_id is None:
+            # 程序开始时获取最新的学生ID和Spine ID
+            global FINAL_STUDENT_ID, FINAL_SPINE_ID
+            FINAL_STUDENT_ID, FINAL_SPINE_ID = await asyncio.gather(
+                get_final_student_id(http_client),
+                get_final_spine_id(http_client)
+            )
+            logging.info(f"程序启动时获取的最新学生ID: {FINAL_STUDENT_ID}, 最新Spine ID: {FINAL_SPINE_ID}")
         
-        return all_student_forms, all_skipped_records
+        # 执行主程序
+        await main(http_client, check_mode, max_concurrent, delay, test_id, no_cache_overwrite, rewrite_outputs, max_concurrent_spine)
+
 
-async def main():
+async def main(http_client: httpx.AsyncClient, check_mode: bool = TEST_MODE, max_concurrent: int = MAX_CONCURRENT_REQUESTS, delay: float = REQUEST_DELAY_SECONDS, test_id: int | None = None, no_cache_overwrite: bool = False, rewrite_outputs: bool = False, max_concurrent_spine: int | None = MAX_CONCURRENT_SPINE_REQUESTS):
     """主执行函数"""
     parser = DataParser()
     cache_manager = CacheManager()
     
+    # 礼貌对待 API：每 delay 秒最多发起 max_concurrent 次学生数据请求，命中缓存时不消耗额度
+    rate_limiter = RateLimiter(delay / max_concurrent)
+    max_concurrent_spine = max_concurrent_spine or max_concurrent
+    client = APIClient(http_client, cache_manager, rate_limiter, max_concurrent_spine)
+
+    # 模式一：测试模式，处理单个ID并退出
+    if test_id is not None:
+        # 根据命令行参数更新全局配置
+        global TEST_OVERWRITE_CACHE
+        TEST_OVERWRITE_CACHE = not no_cache_overwrite
+        await run_test_mode(client, parser, test_id)
+        return
+
+    # --- 以下为完整运行或检查更新模式 ---
+    
     # 读取本地状态
     local_state = await cache_manager.get_state()
     local_max_student_id = local_state.get("max_student_id", 0)
     local_max_spine_id = local_state.get("max_spine_id", 0)
     
     logging.info(f"本地状态: 最大学生ID {local_max_student_id}, 最大Spine ID {local_max_spine_id}")
+    logging.info(f"配置: 最大并发请求数 {max_concurrent}, Spine 最大并发请求数 {max_concurrent_spine}, 请求延迟 {delay}秒")
     
-    async with httpx.AsyncClient() as http_client:
-        # 初始化客户端
-        client = APIClient(http_client, cache_manager)
-        sentinel = Sentinel(http_client)
-        crawler = Crawler(client, parser, cache_manager)
-        
-        # 第一步：检查更新
-        logging.info("开始检查更新...")
-        need_update, remote_max_student_id, remote_max_spine_id = await sentinel.check_updates(local_max_student_id, local_max_spine_id)
-        
-        # 打印更新检查结果
-        logging.info(f"本地学生ID: {local_max_student_id}, 远程学生ID: {remote_max_student_id}")
-        logging.info(f"本地Spine ID: {local_max_spine_id}, 远程Spine ID: {remote_max_spine_id}")
-        logging.info(f"是否需要更新: {need_update}")
-        
-        # 测试模式下，只检查更新，不执行后续逻辑
-        if TEST_MODE:
-            logging.info("测试模式已启用，跳过后续爬取和写入操作。")
-            return
-        
-        # 确定学生ID范围
-        student_ids = list(range(1, remote_max_student_id + 1))
-        
-        all_student_forms: list[StudentForm] = []
-        skipped_records: list[SkippedRecord] = []
-        
-        # 第二步：决策执行
-        if not need_update:
-            logging.info("当前数据已是最新，跳过爬取。")
-            # 模式 A：直接从缓存获取数据
-            all_student_forms, skipped_records = await crawler.get_all_student_forms_from_cache(student_ids)
-        else:
-            logging.info("检测到更新，开始刷新数据...")
-            # 模式 B：触发更新
-            all_student_forms, skipped_records = await crawler.refresh_students(student_ids)
-            
-            # 第三步：状态回写
-            logging.info("更新完成，保存状态...")
-            await cache_manager.save_state(remote_max_student_id, remote_max_spine_id)
-        
-        # 输出统计信息
-        logging.info("-" * 40)
-        logging.info(f"学生数据请求: {client.student_req_count}")
-        logging.info(f"Spine 数据请求: {client.spine_req_count}")
-
-    # 按 file_id 排序以保证输出顺序稳定
-    all_student_forms.sort(key=lambda x: (x.char_id, x.file_id))
-
-    # 按 student_id 和 spine_id 排序以保证输出顺序稳定
-    skipped_records.sort(key=lambda x: (x.student_id, x.spine_id or -1))
-
-    # 写入文件
-    writer = CsvWriter(OUTPUT_FILENAME)
-    writer.write(all_student_forms)
-
-    # 写入跳过记录文件
-    skipped_writer = CsvWriter(SKIPPED_FILENAME)
-    skipped_writer.write_skipped(skipped_records)
-
-
-async def startup(check_mode: bool = TEST_MODE, max_concurrent: int = MAX_CONCURRENT_REQUESTS, delay: float = REQUEST_DELAY_SECONDS, test_id: int | None = None, no_cache_overwrite: bool = False):
-    """程序启动函数，负责初始化配置"""
-    # 测试模式不需要获取全局最新 ID
-    if test_id is None:
-        # 程序开始时获取最新的学生ID和Spine ID
-        global FINAL_STUDENT_ID, FINAL_SPINE_ID
-        FINAL_STUDENT_ID, FINAL_SPINE_ID = await asyncio.gather(
-            get_final_student_id(),
-            get_final_spine_id()
-        )
-        logging.info(f"程序启动时获取的最新学生ID: {FINAL_STUDENT_ID}, 最新Spine ID: {FINAL_SPINE_ID}")
+    sentinel = Sentinel(http_client)
     
-    # 执行主程序
-    await main(check_mode, max_concurrent, delay, test_id, no_cache_overwrite)
-
+    # 检查更新
+    logging.info("开始检查更新...")
+    need_update, remote_max_student_id, remote_max_spine_id = await sentinel.check_updates(local_max_student_id, local_max_spine_id)
+    
+    logging.info(f"本地学生ID: {local_max_student_id}, 远程学生ID: {remote_max_student_id}")
+    logging.info(f"本地Spine ID: {local_max_spine_id}, 远程Spine ID: {remote_max_spine_id}")
+    logging.info(f"是否需要更新: {need_update}")
+    
+    # 模式二：检查更新模式，报告后退出
+    if check_mode:
+        logging.info("检查更新模式已启用，跳过后续爬取和写入操作。")
+        return
+    
+    # 数据无更新、上次运行没有获取失败（网络错误等需重试的ID），且输出文件在上次状态保存之后生成时，
+    # 现有输出即为最新，无需从缓存重新生成；旧状态文件没有失败计数，视为未知，仍需重新生成
+    if not need_update and not rewrite_outputs and local_state.get("fetch_error_count") == 0 and \
+            CsvWriter.outputs_up_to_date((OUTPUT_FILENAME, SKIPPED_FILENAME), cache_manager.state_file):
+        logging.info("当前数据已是最新，输出文件无需重新生成。（使用 --rewrite-outputs 可强制从缓存重新生成）")
+        return
 
-async def main(check_mode: bool = TEST_MODE, max_concurrent: int = MAX_CONCURRENT_REQUESTS, delay: float = REQUEST_DELAY_SECONDS, test_id: int | None = None, no_cache_overwrite: bool = False):
-    """主执行函数"""
-    parser = DataParser()
-    cache_manager = CacheManager()
+    # 模式三：完整执行
+    crawler = Crawler(client, parser, cache_manager, max_concurrent)
+    # 保持为 range：len() 为 O(1)，工作协程按需领取ID，无需物化整个列表
+    student_ids = range(1, remote_max_student_id + 1)
     
-    async with httpx.AsyncClient() as http_client:
-        client = APIClient(http_client, cache_manager)
-
-        # 模式一：测试模式，处理单个ID并退出
-        if test_id is not None:
-            # 根据命令行参数更新全局配置
-            global TEST_OVERWRITE_CACHE
-            TEST_OVERWRITE_CACHE = not no_cache_overwrite
-            await run_test_mode(client, parser, test_id)
-            return
+    # 结果随处理进度按学生ID顺序写入文件，无需在内存中累积全部结果后再排序
+    with CsvWriter(OUTPUT_FILENAME, StudentForm, "记录") as writer, \
+            CsvWriter(SKIPPED_FILENAME, SkippedRecord, "跳过记录") as skipped_writer:
+        sink = OrderedResultSink(student_ids, writer, skipped_writer)
 
-        # --- 以下为完整运行或检查更新模式 ---
-        
-        # 读取本地状态
-        local_state = await cache_manager.get_state()
-        local_max_student_id = local_state.get("max_student_id", 0)
-        local_max_spine_id = local_state.get("max_spine_id", 0)
-        
-        logging.info(f"本地状态: 最大学生ID {local_max_student_id}, 最大Spine ID {local_max_spine_id}")
-        logging.info(f"配置: 最大并发请求数 {max_concurrent}, 请求延迟 {delay}秒")
-        
-        sentinel = Sentinel(http_client)
-        
-        # 检查更新
-        logging.info("开始检查更新...")
-        need_update, remote_max_student_id, remote_max_spine_id = await sentinel.check_updates(local_max_student_id, local_max_spine_id)
-        
-        logging.info(f"本地学生ID: {local_max_student_id}, 远程学生ID: {remote_max_student_id}")
-        logging.info(f"本地Spine ID: {local_max_spine_id}, 远程Spine ID: {remote_max_spine_id}")
-        logging.info(f"是否需要更新: {need_update}")
-        
-        # 模式二：检查更新模式，报告后退出
-        if check_mode:
-            logging.info("检查更新模式已启用，跳过后续爬取和写入操作。")
-            return
-        
-        # 模式三：完整执行
-        crawler = Crawler(client, parser, cache_manager, max_concurrent, delay)
-        student_ids = list(range(1, remote_max_student_id + 1))
-        
-        all_student_forms: list[StudentForm]
-        skipped_records: list[SkippedRecord]
-        
         if not need_update:
             logging.info("当前数据已是最新，从缓存加载。")
-            all_student_forms, skipped_records = await crawler.get_all_student_forms_from_cache(student_ids)
+            await crawler.get_all_student_forms_from_cache(student_ids, sink)
         else:
             logging.info("检测到更新，开始刷新数据...")
-            all_student_forms, skipped_records = await crawler.refresh_students(student_ids)
-            
-            logging.info("更新完成，保存状态...")
-            await cache_manager.save_state(remote_max_student_id, remote_max_spine_id)
-        
-        logging.info("-" * 40)
-        logging.info(f"学生数据请求: {client.student_req_count}")
-        logging.info(f"Spine 数据请求: {client.spine_req_count}")
+            await crawler.refresh_students(student_ids, sink)
 
-    # --- 文件写入部分（移出 async with 块） ---
+        # 状态在输出文件关闭（替换为正式文件）之前保存，输出文件的修改时间因此不早于状态文件
+        if need_update:
+            logging.info("更新完成，保存状态...")
+            await cache_manager.save_state(remote_max_student_id, remote_max_spine_id, client.fetch_error_count)
+        elif remote_max_student_id == local_max_student_id and client.fetch_error_count != local_state.get("fetch_error_count"):
+            # 无新数据，但重新读取时上次失败的ID得到重试：更新失败计数，供下次运行判断能否跳过
+            logging.info(f"获取失败数变为 {client.fetch_error_count}，保存状态...")
+            await cache_manager.save_state(local_max_student_id, local_max_spine_id, client.fetch_error_count)
     
-    # 按 file_id 排序以保证输出顺序稳定
-    all_student_forms.sort(key=lambda x: (x.char_id, x.file_id))
-
-    # 按 student_id 和 spine_id 排序以保证输出顺序稳定
-    skipped_records.sort(key=lambda x: (x.student_id, x.spine_id or -1))
-
-    # 写入文件
-    writer = CsvWriter(OUTPUT_FILENAME)
-    writer.write(all_student_forms)
-
-    # 写入跳过记录文件
-    skipped_writer = CsvWriter(SKIPPED_FILENAME)
-    skipped_writer.write_skipped(skipped_records)
+    logging.info("-" * 40)
+    logging.info(f"学生数据请求: {client.student_req_count}")
+    logging.info(f"Spine 数据请求: {client.spine_req_count}")
 
 async def run_test_mode(client: APIClient, parser: DataParser, test_id: int):
     """
@@ -1173,12 +1350,9 @@ async def list_info():
     print(f"本地最大学生ID: {local_max_student_id}")
     print(f"本地最大Spine ID: {local_max_spine_id}")
     
-    # 统计缓存文件数量
-    student_files = list(cache_manager.students_dir.glob("*.json"))
-    spine_files = list(cache_manager.spines_dir.glob("*.json"))
-    
-    print(f"缓存学生文件数: {len(student_files)}")
-    print(f"缓存Spine文件数: {len(spine_files)}")
+    # 统计缓存文件数量：直接使用 CacheManager 初始化时以 os.scandir 建立的 ID 索引，无需再次遍历目录
+    print(f"缓存学生文件数: {cache_manager.student_count}")
+    print(f"缓存Spine文件数: {cache_manager.spine_count}")
     print("===================")
 
 if __name__ == "__main__":
@@ -1188,14 +1362,16 @@ if __name__ == "__main__":
     parser.add_argument("--test", "-t", type=int, metavar="ID", help="测试模式：只请求指定的学生ID")
     parser.add_argument("--list", "-l", action="store_true", help="列出当前缓存中的学生和皮肤信息")
     parser.add_argument("--max-concurrent", "-m", type=int, default=3, help="最大并发请求数 (默认: 3)")
+    parser.add_argument("--max-concurrent-spine", type=int, default=None, help="Spine 请求的最大并发数 (默认: 与 --max-concurrent 相同)")
     parser.add_argument("--delay", "-d", type=float, default=2.0, help="两次请求之间的间隔（秒） (默认: 2.0)")
     parser.add_argument("--no-cache-overwrite", action="store_true", help="测试模式下不覆盖本地缓存")
+    parser.add_argument("--rewrite-outputs", action="store_true", help="数据无更新时也从缓存重新生成输出文件")
     args = parser.parse_args()
     
     if args.list:
-        asyncio.run(list_info())
+        run_event_loop(list_info())
     elif args.test is not None:
         # 测试模式：只处理指定的学生ID
-        asyncio.run(startup(args.check, args.max_concurrent, args.delay, args.test, args.no_cache_overwrite))
+        run_event_loop(startup(args.check, args.max_concurrent, args.delay, args.test, args.no_cache_overwrite, max_concurrent_spine=args.max_concurrent_spine))
     else:
-        asyncio.run(startup(args.check, args.max_concurrent, args.delay, None, args.no_cache_overwrite))
\ No newline at end of file
+        run_event_loop(startup(args.check, args.max_concurrent, args.delay, None, args.no_cache_overwrite, args.rewrite_outputs, args.max_concurrent_spine))
\ No newline at end of file